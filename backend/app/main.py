@@ -1,3 +1,10 @@
+from .services._threads import TORCH_NUM_THREADS  # first: pins BLAS/OpenMP thread counts
+import asyncio
+import os
+from functools import partial
+from typing import Optional
+
+import anyio
 from fastapi import FastAPI, File, UploadFile, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -5,8 +12,16 @@ from starlette.responses import JSONResponse
 from pathlib import Path
 
 from .models.schemas import MatchResponse, MatchResult
-from .services.embeddings import image_embedding
-from .services.search import INDEX, ACTOR_IMAGES_DIR
+from .services.embeddings import (
+    cache_embedding,
+    cached_embedding,
+    content_hash,
+    embed_prepared,
+    image_embedding_cached,
+    prepare_pixels,
+    stack_embeddings,
+)
+from .services.search import INDEX, ACTOR_IMAGES_DIR, GPU_TENSOR_QUERIES
 
 app = FastAPI(title="Actor Image Matcher", version="0.1.0")
 
@@ -24,6 +39,35 @@ if ACTOR_IMAGES_DIR.exists():
     app.mount("/actors", StaticFiles(directory=str(ACTOR_IMAGES_DIR)), name="actors")
 
 
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# Created lazily: anyio limiters must be constructed inside the running event loop
+_cpu_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+async def _run_cpu(func, *args):
+    """Run CPU-bound work in a worker thread. Each thread may itself use TORCH_NUM_THREADS
+    compute threads, so at most os.cpu_count() // TORCH_NUM_THREADS run at a time."""
+    global _cpu_limiter
+    if _cpu_limiter is None:
+        _cpu_limiter = anyio.CapacityLimiter(max(1, (os.cpu_count() or 1) // TORCH_NUM_THREADS))
+    return await anyio.to_thread.run_sync(func, *args, limiter=_cpu_limiter)
+
+
+async def _upload_source(f: UploadFile):
+    """(source, size) for an upload: the spooled file itself when its size is known,
+    so the decoder streams from it without buffering a copy, else the read bytes."""
+    if f.size is not None:
+        return f.file, f.size
+    contents = await f.read()
+    return contents, len(contents)
+
+
+def _embed_upload(source):
+    # repeated uploads of the same image skip decoding and CLIP entirely
+    return image_embedding_cached(content_hash(source), source, on_device=GPU_TENSOR_QUERIES)
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
@@ -37,12 +81,12 @@ async def match_actors(
     if file.content_type is None or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="이미지 파일을 업로드하세요")
     # 10MB limit safeguard
-    contents = await file.read()
-    if len(contents) > 10 * 1024 * 1024:
+    source, size = await _upload_source(file)
+    if size > MAX_UPLOAD_BYTES:
         raise HTTPException(status_code=413, detail="파일이 너무 큽니다 (최대 10MB)")
 
     try:
-        query = image_embedding(contents)
+        query = await _run_cpu(_embed_upload, source)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"이미지 처리 실패: {e}")
 
@@ -72,27 +116,65 @@ async def match_actors_batch(
 ):
     if not files:
         raise HTTPException(status_code=400, detail="이미지 파일을 업로드하세요")
-    outputs = []
-    for f in files:
+    outputs: list = [None] * len(files)
+    accepted = []
+    for pos, f in enumerate(files):
         if f.content_type is None or not str(f.content_type).startswith("image/"):
-            outputs.append({"filename": f.filename, "error": "이미지 아님"})
+            outputs[pos] = {"filename": f.filename, "error": "이미지 아님"}
             continue
-        contents = await f.read()
-        if len(contents) > 10 * 1024 * 1024:
-            outputs.append({"filename": f.filename, "error": "파일이 너무 큼(>10MB)"})
+        accepted.append((pos, f))
+
+    # read uploads of unknown size concurrently; the rest are decoded from their spooled file
+    sources = await asyncio.gather(*[_upload_source(f) for _, f in accepted])
+    pending = []  # (position, filename, source) of files that passed validation
+    for (pos, f), (source, size) in zip(accepted, sources):
+        if size > MAX_UPLOAD_BYTES:
+            outputs[pos] = {"filename": f.filename, "error": "파일이 너무 큼(>10MB)"}
             continue
-        try:
-            q = image_embedding(contents)
-            top = INDEX.topk(q, k=top_k)
+        pending.append((pos, f.filename, source))
+
+    # hash each upload; images seen recently reuse their cached embedding
+    digests = await asyncio.gather(*[_run_cpu(content_hash, source) for _, _, source in pending])
+    rows = [cached_embedding(digest) for digest in digests]
+    misses = [i for i, row in enumerate(rows) if row is None]
+
+    # decode/preprocess each uncached file in a worker thread, then one batched CLIP forward pass
+    prepared = await asyncio.gather(
+        *[_run_cpu(prepare_pixels, pending[i][2]) for i in misses], return_exceptions=True
+    )
+    fresh = []  # (index into pending, pixels)
+    for i, pixels in zip(misses, prepared):
+        if isinstance(pixels, Exception):
+            pos, filename, _ = pending[i]
+            outputs[pos] = {"filename": filename, "error": f"처리 실패: {pixels}"}
+        else:
+            fresh.append((i, pixels))
+
+    embedded = []
+    try:
+        if fresh:
+            embs = await _run_cpu(
+                partial(embed_prepared, on_device=GPU_TENSOR_QUERIES), [pixels for _, pixels in fresh]
+            )
+            for (i, _), emb in zip(fresh, embs):
+                rows[i] = cache_embedding(digests[i], emb)
+        embedded = [(pos, filename, rows[i]) for i, (pos, filename, _) in enumerate(pending) if rows[i] is not None]
+        tops = INDEX.search_batch(stack_embeddings([row for _, _, row in embedded]), k=top_k) if embedded else []
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        tops = None
+        for pos, filename, _ in pending:
+            if outputs[pos] is None:
+                outputs[pos] = {"filename": filename, "error": f"처리 실패: {e}"}
+
+    if tops is not None:
+        for (pos, filename, _), top in zip(embedded, tops):
             items = []
             for idx, score in top:
                 info = INDEX.info(idx)
                 image_url = f"/actors/{info['image_rel']}" if info.get("image_rel") else None
                 items.append({"name": info.get("name", f"Actor {idx}"), "score": score, "image_url": image_url})
-            outputs.append({"filename": f.filename, "results": items})
-        except FileNotFoundError as e:
-            raise HTTPException(status_code=503, detail=str(e))
-        except Exception as e:
-            outputs.append({"filename": f.filename, "error": f"처리 실패: {e}"})
+            outputs[pos] = {"filename": filename, "results": items}
 
     return {"items": outputs}
@@ -0,0 +1,12 @@
+"""
+Per-process compute thread budget.
+Import this module before numpy, torch, numba or onnxruntime: their BLAS/OpenMP runtimes
+read the *_NUM_THREADS variables once, when they are first loaded.
+"""
+import os
+
+# Intra-op threads per process, so that several server workers do not each spin up a
+# thread per core; run about os.cpu_count() // TORCH_NUM_THREADS workers.
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", str(min(4, os.cpu_count() or 1))))
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMBA_NUM_THREADS"):
+    os.environ.setdefault(_var, str(TORCH_NUM_THREADS))
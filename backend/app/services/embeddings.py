@@ -1,43 +1,134 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
 from functools import lru_cache
 from io import BytesIO
-from typing import Tuple
+from typing import Any, BinaryIO, List, Optional, Tuple, Union
 
+from ._threads import TORCH_NUM_THREADS  # before numpy/torch/numba
 import numpy as np
 from PIL import Image
 import torch
 from transformers import CLIPModel, CLIPProcessor
+
+torch.set_num_threads(TORCH_NUM_THREADS)
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    pass  # already set, or inter-op work has already started in this process
+try:
+    from torchvision.transforms import InterpolationMode  # type: ignore
+    from torchvision.transforms import v2 as T  # type: ignore
+    _TORCHVISION_AVAILABLE = True
+except Exception:
+    _TORCHVISION_AVAILABLE = False
+try:
+    import xxhash  # type: ignore
+    _new_hasher = xxhash.xxh3_128
+except Exception:
+    # Optional dependency. blake2b is slower but always available.
+    _new_hasher = lambda: hashlib.blake2b(digest_size=16)  # noqa: E731
+try:
+    import cv2  # type: ignore
+    _CV2_AVAILABLE = True
+except Exception:
+    # Optional dependency. Without OpenCV (or numba) the CLIP processor does preprocessing.
+    _CV2_AVAILABLE = False
 try:
-    from .face_preprocess import preprocess_face
+    from .face_preprocess import DET_SIZE, preprocess_face
+    from .face_preprocess import _INSIGHTFACE_AVAILABLE as _FACE_AVAILABLE
 except Exception:
     # Optional dependency. If import fails, no face preprocessing will be applied.
     preprocess_face = None  # type: ignore
+    _FACE_AVAILABLE = False
+from .onnx_clip import get_session as get_onnx_session, run_image_tower
+from ._kernels import _NUMBA_AVAILABLE
+
+if _NUMBA_AVAILABLE:
+    from ._kernels import lut_hwc_to_chw
+
 
+# Any HF CLIP checkpoint, e.g. the distilled "wkcn/TinyCLIP-ViT-40M-32-Text-19M-LAION400M".
+# The actor index must be rebuilt after switching models.
+MODEL_NAME = os.getenv("CLIP_MODEL", "openai/clip-vit-base-patch32")
+# "int8" enables weight-only INT8 quantization of the vision tower on CPU (needs torchao)
+CLIP_QUANT = os.getenv("CLIP_QUANT", "").strip().lower()
+# "1" compiles the vision tower with torch.compile (needs a working C++ toolchain)
+CLIP_COMPILE = os.getenv("CLIP_COMPILE", "0") == "1"
+# Images per CLIP forward pass; larger batches are embedded in chunks of this size
+MAX_BATCH = int(os.getenv("CLIP_MAX_BATCH", "64"))
+# Query embeddings kept per content hash (0 disables the cache)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
 
-MODEL_NAME = "openai/clip-vit-base-patch32"
+# raw upload bytes, or a binary file object (e.g. the spooled file behind an UploadFile)
+ImageSource = Union[bytes, BinaryIO]
 
 
-def _load_image(img_bytes: bytes) -> Image.Image:
-    image = Image.open(BytesIO(img_bytes))
+@lru_cache(maxsize=1)
+def _draft_size() -> Tuple[int, int]:
+    """Smallest decode size that still feeds the face detector / CLIP at full resolution."""
+    if _FACE_AVAILABLE:
+        return DET_SIZE
+    edge = int(get_processor().image_processor.size["shortest_edge"])
+    return edge, edge
+
+
+def _load_image(src: ImageSource) -> Image.Image:
+    image = Image.open(BytesIO(src) if isinstance(src, (bytes, bytearray)) else src)
+    # JPEG only (no-op otherwise): libjpeg decodes at 1/2, 1/4 or 1/8 scale while
+    # both sides stay >= the draft size, skipping most of the IDCT work
+    image.draft("RGB", _draft_size())
     if image.mode != "RGB":
         image = image.convert("RGB")
     return image
 
 
+@lru_cache(maxsize=1)
+def get_processor() -> CLIPProcessor:
+    return CLIPProcessor.from_pretrained(MODEL_NAME)
+
+
 @lru_cache(maxsize=1)
 def get_clip() -> Tuple[CLIPModel, CLIPProcessor, torch.device]:
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     model = CLIPModel.from_pretrained(MODEL_NAME)
-    processor = CLIPProcessor.from_pretrained(MODEL_NAME)
+    processor = get_processor()
     model.eval().to(device)
+    # NHWC weights let the patch-embedding conv hit oneDNN/cuDNN channels_last kernels
+    model.vision_model.to(memory_format=torch.channels_last)
+    quantized = CLIP_QUANT == "int8" and _quantize_int8(model, device)
+    if CLIP_COMPILE or quantized:
+        # torchao also relies on torch.compile to fuse dequantization into the matmuls
+        model.vision_model = torch.compile(model.vision_model, dynamic=False)
     return model, processor, device
 
 
-def image_embedding(img_bytes: bytes) -> np.ndarray:
-    """Compute an L2-normalized CLIP image embedding (np.ndarray float32).
-    Optionally applies face detection/cropping if insightface is available.
-    """
-    model, processor, device = get_clip()
-    image = _load_image(img_bytes)
+def _int8_supported(device: torch.device) -> bool:
+    # int8 weight-only kernels are only faster than FP32 on x86 CPUs with AVX2/AVX-512(VNNI)
+    if device.type != "cpu":
+        return False
+    try:
+        return torch.backends.cpu.get_cpu_capability() in {"AVX2", "AVX512"}
+    except Exception:
+        return False
+
+
+def _quantize_int8(model: CLIPModel, device: torch.device) -> bool:
+    """Quantize the vision tower weights to INT8 in place; returns False when unsupported."""
+    if not _int8_supported(device):
+        return False
+    try:
+        from torchao.quantization import int8_weight_only, quantize_  # type: ignore
+    except Exception:
+        # Optional dependency. Keep the FP32 model if torchao is not installed.
+        return False
+    quantize_(model.vision_model, int8_weight_only())
+    return True
+
+
+def _prepare_image(src: ImageSource) -> Image.Image:
+    image = _load_image(src)
     # optional face preprocessing (largest aligned face)
     if preprocess_face is not None:
         try:
@@ -47,10 +138,224 @@ def image_embedding(img_bytes: bytes) -> np.ndarray:
         except Exception:
             # fallback to original image on any failure
             pass
-    inputs = processor(images=image, return_tensors="pt")
-    with torch.no_grad():
-        pixel_values = inputs["pixel_values"].to(device)
-        feats = model.get_image_features(pixel_values=pixel_values)
-        feats = feats / feats.norm(p=2, dim=-1, keepdim=True)
-    emb = feats.squeeze(0).detach().cpu().numpy().astype("float32")
+    return image
+
+
+@lru_cache(maxsize=1)
+def _preprocess_spec() -> Tuple[np.ndarray, int, Tuple[int, int]]:
+    """(lut, shortest_edge, (crop_h, crop_w)) mirroring the CLIP image processor config.
+
+    Input pixels are uint8, so rescale + mean/std normalization collapse into a
+    (3, 256) float32 lookup table: lut[c, v] = (v / 255 - mean[c]) / std[c].
+    """
+    ip = get_processor().image_processor
+    mean = np.asarray(ip.image_mean, dtype=np.float32)[:, None]
+    std = np.asarray(ip.image_std, dtype=np.float32)[:, None]
+    lut = np.ascontiguousarray((np.arange(256, dtype=np.float32)[None, :] / 255.0 - mean) / std)
+    crop = (int(ip.crop_size["height"]), int(ip.crop_size["width"]))
+    return lut, int(ip.size["shortest_edge"]), crop
+
+
+def _fast_preprocess(img_np: np.ndarray, out: np.ndarray) -> None:
+    """Resize (shortest edge) + center crop + normalize an RGB uint8 image into out (3, H, W)."""
+    lut, shortest, (crop_h, crop_w) = _preprocess_spec()
+    h, w = img_np.shape[:2]
+    scale = shortest / min(h, w)
+    # truncate like the CLIP image processor so both center crops start at the same pixel
+    new_w, new_h = max(crop_w, int(w * scale)), max(crop_h, int(h * scale))
+    interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    resized = cv2.resize(img_np, (new_w, new_h), interpolation=interp)
+    top, left = (new_h - crop_h) // 2, (new_w - crop_w) // 2
+    lut_hwc_to_chw(resized[top : top + crop_h, left : left + crop_w], lut, out)
+
+
+@lru_cache(maxsize=1)
+def _get_transform() -> "T.Compose":
+    """torchvision version of the CLIP processor's pixel_values pipeline (see _pixel_values)."""
+    ip = get_processor().image_processor
+    return T.Compose(
+        [
+            T.Resize(ip.size["shortest_edge"], interpolation=InterpolationMode.BICUBIC, antialias=True),
+            T.CenterCrop((ip.crop_size["height"], ip.crop_size["width"])),
+            T.PILToTensor(),
+            T.ToDtype(torch.float32, scale=True),
+            T.Normalize(mean=ip.image_mean, std=ip.image_std),
+        ]
+    )
+
+
+def _pixel_values(images: List[Image.Image]) -> torch.Tensor:
+    """(N, 3, H, W) float32 CPU tensor of CLIP input for a list of images.
+
+    The Numba/OpenCV, torchvision and CLIPProcessor paths agree only to within
+    interpolation differences (tests/test_embeddings.py); query with the same optional
+    packages the actor index was built with, or rebuild the index after changing them.
+    """
+    if _NUMBA_AVAILABLE and _CV2_AVAILABLE and all(img.mode == "RGB" for img in images):
+        _, _, (crop_h, crop_w) = _preprocess_spec()
+        out = torch.empty((len(images), 3, crop_h, crop_w), dtype=torch.float32)
+        out_np = out.numpy()
+        for i, img in enumerate(images):
+            _fast_preprocess(np.asarray(img), out_np[i])
+        return out
+    if _TORCHVISION_AVAILABLE:
+        tx = _get_transform()
+        return torch.stack([tx(img) for img in images])
+    return get_processor()(images=images, return_tensors="pt")["pixel_values"]
+
+
+_STAGING_LOCK = threading.Lock()
+_staging_free: Optional["torch.cuda.Event"] = None  # recorded after the last upload out of the buffer
+
+
+@lru_cache(maxsize=1)
+def _staging_buffer() -> torch.Tensor:
+    """Pinned (MAX_BATCH, 3, H, W) host buffer reused for every host -> GPU upload."""
+    _, _, (crop_h, crop_w) = _preprocess_spec()
+    return torch.empty((MAX_BATCH, 3, crop_h, crop_w), dtype=torch.float32, pin_memory=True)
+
+
+@lru_cache(maxsize=1)
+def _copy_stream() -> "torch.cuda.Stream":
+    return torch.cuda.Stream()
+
+
+def _to_device(pixels: List[torch.Tensor], device: torch.device) -> torch.Tensor:
+    """Stack preprocessed (3, H, W) tensors into a channels_last batch on device.
+
+    On CUDA the tensors are stacked straight into the pinned staging buffer and uploaded
+    on a dedicated copy stream. Only that memcpy and the upload hold the buffer lock;
+    the next writer waits on the copy's event, and so does the compute stream.
+    """
+    global _staging_free
+    if device.type != "cuda":
+        return torch.stack(pixels).to(device, memory_format=torch.channels_last)
+    stream = _copy_stream()
+    with _STAGING_LOCK:
+        if _staging_free is not None:
+            _staging_free.synchronize()  # the previous upload may still be reading the buffer
+        staged = torch.stack(pixels, out=_staging_buffer()[: len(pixels)])
+        with torch.cuda.stream(stream):
+            out = staged.to(device, non_blocking=True).contiguous(memory_format=torch.channels_last)
+            done = torch.cuda.Event()
+            done.record(stream)
+        _staging_free = done
+    compute = torch.cuda.current_stream(device)
+    compute.wait_event(done)
+    out.record_stream(compute)  # allocated on the copy stream, consumed on the compute stream
+    return out
+
+
+def _forward(pixels: List[torch.Tensor], on_device: bool = False) -> Union[np.ndarray, torch.Tensor]:
+    """Run CLIP over preprocessed (3, H, W) tensors; returns (N, D) normalized rows.
+
+    With on_device=True a CUDA model returns the rows as a CUDA tensor, skipping the
+    device -> host copy (for a GPU faiss index); otherwise rows are np.ndarray float32.
+    """
+    session = get_onnx_session()
+    if session is not None:
+        # exported image tower (see onnx_clip.py); the PyTorch model is never loaded
+        return run_image_tower(session, torch.stack(pixels).numpy())
+    model, _, device = get_clip()
+    chunks = []
+    with torch.inference_mode():
+        for start in range(0, len(pixels), MAX_BATCH):
+            batch = _to_device(pixels[start : start + MAX_BATCH], device)
+            feats = model.get_image_features(pixel_values=batch)
+            chunks.append(feats / feats.norm(p=2, dim=-1, keepdim=True))
+        feats = torch.cat(chunks)
+    if on_device and feats.is_cuda:
+        return feats.float()
+    return feats.detach().cpu().numpy().astype("float32")
+
+
+def prepare_pixels(src: ImageSource) -> torch.Tensor:
+    """Decode, face-crop and preprocess one image into a (3, H, W) CLIP input tensor.
+
+    Callers may run it for several uploads in worker threads and then embed the
+    results together with embed_prepared.
+    """
+    return _pixel_values([_prepare_image(src)])[0]
+
+
+def embed_prepared(pixels: List[torch.Tensor], on_device: bool = False) -> Union[np.ndarray, torch.Tensor]:
+    """Embed tensors from prepare_pixels with a single CLIP forward pass."""
+    return _forward(pixels, on_device=on_device)
+
+
+def image_embedding(src: ImageSource, on_device: bool = False) -> np.ndarray:
+    """Compute an L2-normalized CLIP image embedding (np.ndarray float32).
+    Optionally applies face detection/cropping if insightface is available.
+    on_device=True may return a CUDA tensor instead (see _forward).
+    """
+    # preprocessed before _forward, so no CPU work runs under the staging lock
+    return _forward([prepare_pixels(src)], on_device=on_device)[0]
+
+
+# content hash -> embedding row; keys carry the model generation so reload_models()
+# invalidates every entry computed with the previous weights
+_EMB_CACHE: "OrderedDict[Tuple[int, str], Any]" = OrderedDict()
+_EMB_CACHE_LOCK = threading.Lock()
+_cache_generation = 0
+
+
+def content_hash(src: ImageSource) -> str:
+    """Hex digest of an upload (xxh3-128, or blake2b without xxhash); file objects are rewound."""
+    h = _new_hasher()
+    if isinstance(src, (bytes, bytearray)):
+        h.update(src)
+    else:
+        pos = src.tell()
+        for chunk in iter(lambda: src.read(1 << 20), b""):
+            h.update(chunk)
+        src.seek(pos)
+    return h.hexdigest()
+
+
+def cached_embedding(digest: str) -> Optional[Any]:
+    """Embedding previously stored for this content hash, or None."""
+    key = (_cache_generation, digest)
+    with _EMB_CACHE_LOCK:
+        emb = _EMB_CACHE.get(key)
+        if emb is not None:
+            _EMB_CACHE.move_to_end(key)
+        return emb
+
+
+def cache_embedding(digest: str, emb: Any) -> Any:
+    """Store one embedding row (np.ndarray or CUDA tensor) and return the stored copy."""
+    emb = emb.clone() if isinstance(emb, torch.Tensor) else np.array(emb, dtype=np.float32)
+    if isinstance(emb, np.ndarray):
+        emb.setflags(write=False)  # shared between requests
+    if QUERY_CACHE_SIZE <= 0:
+        return emb
+    with _EMB_CACHE_LOCK:
+        _EMB_CACHE[(_cache_generation, digest)] = emb
+        while len(_EMB_CACHE) > QUERY_CACHE_SIZE:
+            _EMB_CACHE.popitem(last=False)
+    return emb
+
+
+def image_embedding_cached(digest: str, src: ImageSource, on_device: bool = False) -> Any:
+    """image_embedding, reusing the result for uploads with the same content hash."""
+    emb = cached_embedding(digest)
+    if emb is None:
+        emb = cache_embedding(digest, image_embedding(src, on_device=on_device))
     return emb
+
+
+def stack_embeddings(rows: List[Any]) -> Any:
+    """Stack rows from image_embedding_cached / cache_embedding into a (B, D) batch."""
+    if rows and isinstance(rows[0], torch.Tensor):
+        return torch.stack(rows)
+    return np.stack(rows)
+
+
+def reload_models() -> None:
+    """Drop the loaded model, processor and preprocessing state; cached embeddings expire."""
+    global _cache_generation
+    for cached in (get_clip, get_processor, get_onnx_session, _preprocess_spec, _get_transform, _draft_size, _staging_buffer):
+        cached.cache_clear()
+    with _EMB_CACHE_LOCK:
+        _cache_generation += 1
+        _EMB_CACHE.clear()
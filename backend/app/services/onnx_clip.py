@@ -0,0 +1,83 @@
+"""
+Optional ONNX Runtime backend for the CLIP image tower.
+Export the tower once (backend/scripts/export_onnx_clip.py); when the exported file exists
+and onnxruntime is installed, image embeddings are computed with ONNX Runtime instead of PyTorch.
+"""
+from __future__ import annotations
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+try:
+    import onnxruntime as ort  # type: ignore
+    _ORT_AVAILABLE = True
+except Exception:  # pragma: no cover
+    ort = None  # type: ignore
+    _ORT_AVAILABLE = False
+
+try:
+    import faiss  # type: ignore
+except Exception:  # pragma: no cover
+    faiss = None  # type: ignore
+
+
+ONNX_PATH = Path(
+    os.getenv("CLIP_ONNX_PATH", str(Path(__file__).resolve().parents[1] / "data" / "clip_vision.onnx"))
+)
+
+
+def export_vision_onnx(model_name: str, out_path: Path = ONNX_PATH) -> Path:
+    """Export `get_image_features` of a HF CLIP checkpoint to ONNX with a dynamic batch axis."""
+    import torch
+    from transformers import CLIPModel
+
+    class _ImageTower(torch.nn.Module):
+        def __init__(self, model: CLIPModel):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model.get_image_features(pixel_values=pixel_values)
+
+    model = CLIPModel.from_pretrained(model_name).eval()
+    size = model.config.vision_config.image_size
+    dummy = torch.zeros(1, 3, size, size)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    torch.onnx.export(
+        _ImageTower(model),
+        (dummy,),
+        str(out_path),
+        input_names=["pixel_values"],
+        output_names=["image_embeds"],
+        dynamic_axes={"pixel_values": {0: "N"}, "image_embeds": {0: "N"}},
+        opset_version=17,
+    )
+    return out_path
+
+
+@lru_cache(maxsize=1)
+def get_session() -> Optional[Any]:
+    """ONNX Runtime session for the exported tower, or None if unavailable."""
+    if not _ORT_AVAILABLE or not ONNX_PATH.exists():
+        return None
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # same per-process thread budget as PyTorch (see TORCH_NUM_THREADS in _threads.py)
+    so.intra_op_num_threads = int(os.getenv("OMP_NUM_THREADS", str(os.cpu_count() or 1)))
+    so.inter_op_num_threads = 1
+    providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in ort.get_available_providers()]
+    return ort.InferenceSession(str(ONNX_PATH), sess_options=so, providers=providers)
+
+
+def run_image_tower(session: Any, pixel_values: np.ndarray) -> np.ndarray:
+    """Embed a (N, 3, H, W) float32 batch; returns (N, D) L2-normalized rows."""
+    feats = session.run(None, {"pixel_values": np.ascontiguousarray(pixel_values, dtype=np.float32)})[0]
+    feats = np.ascontiguousarray(feats, dtype=np.float32)
+    if faiss is not None:
+        faiss.normalize_L2(feats)
+    else:
+        feats /= np.linalg.norm(feats, axis=1, keepdims=True) + 1e-12
+    return feats
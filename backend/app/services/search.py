@@ -1,20 +1,131 @@
 import json
+import logging
+import os
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+from . import _threads  # noqa: F401  # before numpy/faiss/numba
 import numpy as np
+try:
+    import faiss  # type: ignore
+    _FAISS_AVAILABLE = True
+except Exception as e:  # pragma: no cover
+    # Optional dependency. Without faiss the index falls back to a NumPy scan; say so, since
+    # a broken install (e.g. a wheel built against another NumPy ABI) fails the same way.
+    logging.getLogger(__name__).warning("faiss unavailable (%s); searching with the NumPy/Numba scan", e)
+    faiss = None  # type: ignore
+    _FAISS_AVAILABLE = False
+
+from ._kernels import _NUMBA_AVAILABLE
+
+if _NUMBA_AVAILABLE:
+    from ._kernels import dot_topk
 
 DATA_DIR = Path(__file__).resolve().parents[1] / "data"
 EMB_PATH = DATA_DIR / "embeddings.npy"
 META_PATH = DATA_DIR / "metadata.json"
+INDEX_PATH = DATA_DIR / "index.faiss"  # prebuilt quantized faiss index (optional)
 ACTOR_IMAGES_DIR = DATA_DIR / "actors"  # optional folder for serving images
 
+# Catalogs with at least this many rows use a trained IVF-PQ index instead of exact search
+IVF_THRESHOLD = int(os.getenv("FAISS_IVF_THRESHOLD", "50000"))
+IVF_FACTORY = os.getenv("FAISS_IVF_FACTORY", "IVF256,PQ16")
+IVF_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+# Set to 0 to keep the faiss index on CPU even when faiss-gpu sees a device
+FAISS_GPU = os.getenv("FAISS_GPU", "1") == "1"
+# Rows are L2-normalized by the index builder; set to 1 to verify that at load time
+CHECK_NORMS = os.getenv("ACTOR_INDEX_CHECK_NORMS", "0") == "1"
+# Below this many rows a Numba scan of the memory-mapped rows replaces an exact faiss index
+# built at load time (0 disables it). A prebuilt index.faiss is always preferred.
+NUMBA_TOPK_MAX_ROWS = int(os.getenv("NUMBA_TOPK_MAX_ROWS", "50000"))
+# Rows upcast from float16 storage at a time (NumPy scan, faiss add/train)
+TILE_ROWS = 16384
+# faiss trains IVF-PQ on at most this many rows
+TRAIN_ROWS = 100_000
+
+
+def _gpu_count() -> int:
+    if not _FAISS_AVAILABLE or not FAISS_GPU or not hasattr(faiss, "StandardGpuResources"):
+        return 0
+    return faiss.get_num_gpus()
+
+
+GPU_SEARCH = _gpu_count() > 0
+# faiss' torch interop lets the GPU index take CUDA query tensors without a host round-trip
+GPU_TENSOR_QUERIES = False
+if GPU_SEARCH:
+    try:
+        import faiss.contrib.torch_utils  # type: ignore  # noqa: F401
+        GPU_TENSOR_QUERIES = True
+    except Exception:
+        pass
+
+
+def _f32(rows: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(rows, dtype=np.float32)
+
+
+def _build_faiss_index(emb: np.ndarray, quantized: bool = False) -> Any:
+    """Inner-product index for small catalogs, IVF-PQ above IVF_THRESHOLD.
+
+    Small catalogs get an exact IndexFlatIP for float32 rows, a float16 scalar
+    quantizer for float16 rows (same precision, half the bytes), or an 8-bit scalar
+    quantizer (1 byte per dimension) when `quantized` is set.
+    """
+    d = emb.shape[1]
+    if emb.shape[0] >= IVF_THRESHOLD:
+        index = faiss.index_factory(d, IVF_FACTORY, faiss.METRIC_INNER_PRODUCT)
+        index.train(_f32(emb[:TRAIN_ROWS]))
+        faiss.extract_index_ivf(index).nprobe = IVF_NPROBE
+    elif quantized:
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(_f32(emb))
+    elif emb.dtype == np.float16:
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexFlatIP(d)
+    for start in range(0, emb.shape[0], TILE_ROWS):
+        index.add(_f32(emb[start : start + TILE_ROWS]))
+    return index
+
+
+def save_quantized_index(emb: np.ndarray, path: Path = INDEX_PATH) -> bool:
+    """Write the quantized faiss index loaded by ActorIndex; False if faiss is not installed."""
+    if not _FAISS_AVAILABLE:
+        return False
+    faiss.write_index(_build_faiss_index(emb, quantized=True), str(path))
+    return True
+
+
+def _read_faiss_index(path: Path) -> Any:
+    index = faiss.read_index(str(path))
+    try:
+        faiss.extract_index_ivf(index).nprobe = IVF_NPROBE
+    except RuntimeError:
+        pass  # not an IVF index
+    return index
+
+
+def _topk_rows(sims: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k largest entries of each row of sims, best first."""
+    n = sims.shape[1]
+    if k < n:
+        # O(N) selection, then only the k survivors are sorted
+        part = np.argpartition(sims, n - k, axis=1)[:, n - k :]
+    else:
+        part = np.broadcast_to(np.arange(n), sims.shape)
+    order = np.argsort(-np.take_along_axis(sims, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
 
 class ActorIndex:
     def __init__(self):
         self._loaded = False
-        self._emb: Optional[np.ndarray] = None  # shape (N, D) normalized
+        self._emb: Optional[np.ndarray] = None  # shape (N, D) normalized, read-only, float16/32
         self._meta: Optional[List[Dict]] = None  # list of {name, image_rel}
+        self._index: Any = None  # faiss index over self._emb when faiss is installed
+        self._gpu_res: Any = None  # faiss.StandardGpuResources backing a GPU index
+        self._numba = False  # scan self._emb with the Numba kernel (small catalogs)
 
     def ensure_loaded(self) -> None:
         if self._loaded:
@@ -23,25 +134,87 @@ class ActorIndex:
             raise FileNotFoundError(
                 "Actor index not built. Run the index builder script to create embeddings and metadata."
             )
-        self._emb = np.load(str(EMB_PATH)).astype("float32")
-        # ensure normalized rows
-        norms = np.linalg.norm(self._emb, axis=1, keepdims=True) + 1e-12
-        self._emb = self._emb / norms
+        # memory-mapped: pages are read on demand and can be evicted, no private copy
+        self._emb = np.load(str(EMB_PATH), mmap_mode="r")
+        if self._emb.dtype not in (np.float16, np.float32):
+            self._emb = self._emb.astype(np.float32)
+        if CHECK_NORMS and self._emb.size and not np.allclose(np.linalg.norm(_f32(self._emb), axis=1), 1.0, atol=1e-3):
+            raise ValueError("Embeddings are not L2-normalized; rebuild the actor index")
         with open(META_PATH, "r", encoding="utf-8") as f:
             self._meta = json.load(f)
         if len(self._meta) != self._emb.shape[0]:
             raise ValueError("Metadata and embeddings row counts do not match")
+        n = self._emb.shape[0] if self._emb.ndim == 2 else 0
+        if _FAISS_AVAILABLE and n > 0 and INDEX_PATH.exists():
+            self._index = _read_faiss_index(INDEX_PATH)
+            if self._index.ntotal != n:
+                # stale file from an earlier build; index the embeddings directly
+                self._index = None
+        if self._index is None and _NUMBA_AVAILABLE and 0 < n < NUMBA_TOPK_MAX_ROWS and not GPU_SEARCH:
+            # reads the mmap in place (float16 included), no private copy of the rows
+            self._numba = True
+            dot_topk(self._emb[:1], _f32(self._emb[:1]), 1)  # compile (or load the cached kernel) now
+        elif _FAISS_AVAILABLE and n > 0:
+            if self._index is None:
+                self._index = _build_faiss_index(self._emb)
+            if GPU_SEARCH:
+                self._index = self._to_gpu(self._index)
         self._loaded = True
 
+    def _to_gpu(self, index: Any) -> Any:
+        self._gpu_res = faiss.StandardGpuResources()
+        try:
+            return faiss.index_cpu_to_gpu(self._gpu_res, 0, index)
+        except RuntimeError:
+            # the flat scalar quantizer has no GPU implementation; use exact search there
+            flat = faiss.IndexFlatIP(self._emb.shape[1])
+            for start in range(0, self._emb.shape[0], TILE_ROWS):
+                flat.add(_f32(self._emb[start : start + TILE_ROWS]))
+            return faiss.index_cpu_to_gpu(self._gpu_res, 0, flat)
+
     def topk(self, query_emb: np.ndarray, k: int = 3) -> List[Tuple[int, float]]:
+        return self.search_batch(query_emb.reshape(1, -1), k)[0]
+
+    def search_batch(self, queries: np.ndarray, k: int = 3) -> List[List[Tuple[int, float]]]:
+        """Top-k (index, score) lists for each row of a (B, D) L2-normalized query matrix.
+
+        With GPU_TENSOR_QUERIES, queries may also be a CUDA torch tensor; only the
+        top-k ids and scores are copied back to the host.
+        """
         self.ensure_loaded()
         assert self._emb is not None
-        q = query_emb.astype("float32")
-        q = q / (np.linalg.norm(q) + 1e-12)
-        # cosine similarity via dot product since rows are normalized
-        sims = self._emb @ q
-        idx = np.argsort(-sims)[:k]
-        return [(int(i), float(sims[i])) for i in idx]
+        if self._index is not None and GPU_TENSOR_QUERIES and not isinstance(queries, np.ndarray):
+            scores, ids = self._index.search(queries.contiguous(), k)
+            scores, ids = scores.cpu().numpy(), ids.cpu().numpy()
+        else:
+            if not isinstance(queries, np.ndarray):
+                queries = queries.detach().cpu().numpy()
+            q = np.ascontiguousarray(queries, dtype=np.float32)
+            if self._numba:
+                # one pass over the rows for the whole batch
+                ids, scores = dot_topk(self._emb, q, k)
+            elif self._index is not None:
+                scores, ids = self._index.search(q, k)
+            else:
+                sims = self._scan(q)
+                idx = _topk_rows(sims, k)
+                return [[(int(i), float(row[i])) for i in row_idx] for row, row_idx in zip(sims, idx)]
+        # faiss pads with -1 when k exceeds the number of rows
+        return [
+            [(int(i), float(s)) for i, s in zip(row_ids, row_scores) if i >= 0]
+            for row_ids, row_scores in zip(ids, scores)
+        ]
+
+    def _scan(self, q: np.ndarray) -> np.ndarray:
+        """(B, N) cosine similarities via dot products, since rows are normalized."""
+        if self._emb.dtype == np.float32:
+            return q @ self._emb.T
+        # float16 storage halves the bytes read; upcast one tile at a time for the matmul
+        n = self._emb.shape[0]
+        sims = np.empty((q.shape[0], n), dtype=np.float32)
+        for start in range(0, n, TILE_ROWS):
+            sims[:, start : start + TILE_ROWS] = q @ _f32(self._emb[start : start + TILE_ROWS]).T
+        return sims
 
     def info(self, idx: int) -> Dict:
         assert self._meta is not None
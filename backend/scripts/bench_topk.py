@@ -0,0 +1,57 @@
+"""
+Numba top-k 커널 마이크로 벤치마크
+
+search.py의 작은 카탈로그 경로(_kernels.dot_topk)와 NumPy 행렬곱 + argpartition 탐색을
+같은 무작위 임베딩으로 비교합니다. 커널을 수정했다면 실행해서 NumPy보다 느려지지 않았는지 확인하세요.
+
+python -m backend.scripts.bench_topk --dim 512 --rows 2000 20000 49000
+"""
+from __future__ import annotations
+import argparse
+import time
+
+from backend.app.services import _threads  # noqa: F401  # numpy/numba 보다 먼저 (스레드 수 고정)
+import numpy as np
+
+from backend.app.services._kernels import _NUMBA_AVAILABLE
+
+
+def _ms(func, repeat: int) -> float:
+    func()  # 워밍업 (JIT 컴파일 포함)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 20000, 49000])
+    parser.add_argument("--batch", type=int, default=1, help="쿼리 수")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    if not _NUMBA_AVAILABLE:
+        raise SystemExit("numba 미설치")
+    from backend.app.services._kernels import dot_topk
+
+    rng = np.random.default_rng(0)
+    q = rng.standard_normal((args.batch, args.dim)).astype("float32")
+    for dtype in ("float32", "float16"):
+        for n in args.rows:
+            emb = rng.standard_normal((n, args.dim)).astype("float32")
+            emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+            emb = emb.astype(dtype)
+
+            def numpy_scan():
+                sims = q @ emb.astype("float32", copy=False).T
+                np.argpartition(sims, n - args.k, axis=1)
+
+            numba_ms = _ms(lambda: dot_topk(emb, q, args.k), args.repeat)
+            numpy_ms = _ms(numpy_scan, args.repeat)
+            print(f"{dtype} rows={n}: numba {numba_ms:.2f} ms, numpy {numpy_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,23 +13,28 @@
    => 같은 이름을 가진 이미지들을 그룹핑하여 평균
 
 출력: backend/app/data/
-  - embeddings.npy (shape: [N_actors, D])
+  - embeddings.npy (shape: [N_actors, D], float16)
   - metadata.json (list[{name, image_rel}])
+  - index.faiss (8bit 양자화 faiss 인덱스, faiss 설치 시)
   - actors/ (대표 이미지 복사본)
 """
 from __future__ import annotations
 import argparse
 import csv
 import json
+import os
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
+from backend.app.services import _threads  # noqa: F401  # numpy/torch 보다 먼저 (스레드 수 고정)
 import numpy as np
+import torch
 from PIL import Image
 
-from backend.app.services.embeddings import image_embedding
-from backend.app.services.search import DATA_DIR, ACTOR_IMAGES_DIR
+from backend.app.services.embeddings import embed_prepared, prepare_pixels
+from backend.app.services.search import DATA_DIR, ACTOR_IMAGES_DIR, INDEX_PATH, save_quantized_index
 
 
 def iter_folder(dataset_dir: Path) -> Dict[str, List[Path]]:
@@ -54,59 +59,110 @@ def iter_csv(csv_path: Path) -> Dict[str, List[Path]]:
     return mapping
 
 
-def compute_actor_vectors(groups: Dict[str, List[Path]], clusters_per_actor: int = 1) -> Tuple[np.ndarray, List[Dict]]:
+def _prepare(path: Path) -> Optional[torch.Tensor]:
+    try:
+        with open(path, "rb") as f:
+            return prepare_pixels(f)
+    except Exception:
+        # 이미지 깨짐 등은 무시
+        return None
+
+
+def _embed_paths(paths: List[Path], batch_size: int) -> Tuple[np.ndarray, List[int]]:
+    """경로 목록을 batch_size 단위로 임베딩 (디코딩은 스레드 병렬, 다음 배치 디코딩과 CLIP 추론을 겹침).
+    반환: (성공한 이미지 임베딩 [M, D], 성공한 경로의 인덱스 목록)"""
+    embs: List[np.ndarray] = []
+    ok: List[int] = []
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+        futures = [pool.submit(_prepare, p) for p in paths[:batch_size]]
+        for start in range(0, len(paths), batch_size):
+            current = futures
+            # 다음 배치 디코딩을 미리 시작해 현재 배치의 CLIP 추론과 겹치게 함
+            futures = [pool.submit(_prepare, p) for p in paths[start + batch_size : start + 2 * batch_size]]
+            pixels = [(start + j, f.result()) for j, f in enumerate(current)]
+            pixels = [(i, px) for i, px in pixels if px is not None]
+            if not pixels:
+                continue
+            embs.append(embed_prepared([px for _, px in pixels]))
+            ok.extend(i for i, _ in pixels)
+    if not embs:
+        return np.empty((0, 0), dtype="float32"), ok
+    return np.concatenate(embs, axis=0), ok
+
+
+def _copy_representative(name: str, path: Path) -> Optional[str]:
+    # 대표 이미지 복사 (상대경로 저장)
+    target = ACTOR_IMAGES_DIR / f"{name.replace(' ', '_')}{path.suffix.lower()}"
+    if not target.exists():
+        try:
+            Image.open(path).save(target)
+        except Exception:
+            pass
+    return target.name if target.exists() else None
+
+
+def _group_means(E: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """배우별 평균 벡터 (정규화 전). 행 합이 1인 희소 그룹 행렬 G (n_actors x n_images)로
+    means = G @ E 를 한 번에 계산 (scipy 미설치 시 np.add.reduceat)"""
+    sizes = ends - starts
+    try:
+        from scipy import sparse  # type: ignore
+    except Exception:
+        return np.add.reduceat(E, starts, axis=0) / sizes[:, None]
+    actor_idx = np.repeat(np.arange(len(starts)), sizes)
+    G = sparse.csr_matrix(
+        ((1.0 / sizes[actor_idx]).astype(E.dtype), (actor_idx, np.arange(len(E)))),
+        shape=(len(starts), len(E)),
+    )
+    return np.asarray(G @ E)
+
+
+def compute_actor_vectors(
+    groups: Dict[str, List[Path]], clusters_per_actor: int = 1, batch_size: int = 64
+) -> Tuple[np.ndarray, List[Dict]]:
     ACTOR_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+    # (배우, 경로)를 배우 이름 순으로 평탄화, 배우당 최대 20장까지 샘플링
+    items = [(name, p) for name, paths in sorted(groups.items()) for p in paths[:20]]
+    E, ok = _embed_paths([p for _, p in items], batch_size)
+    if not ok:
+        raise SystemExit("임베딩에 성공한 이미지가 없습니다")
+    names = [items[i][0] for i in ok]
+    # 배우별 연속 구간의 시작 위치 (items가 이름순이므로 같은 배우는 붙어 있음)
+    starts = np.flatnonzero([i == 0 or names[i] != names[i - 1] for i in range(len(names))])
+    ends = np.append(starts[1:], len(names))
+    actor_names = [names[i] for i in starts]
+    rep_rels = [_copy_representative(names[i], items[ok[i]][1]) for i in starts]
+
+    means = _group_means(E, starts, ends)
+    means /= np.linalg.norm(means, axis=1, keepdims=True) + 1e-12
+    means = means.astype("float32")
+    if clusters_per_actor <= 1:
+        meta = [{"name": n, "image_rel": r} for n, r in zip(actor_names, rep_rels)]
+        return means, meta
+
     vectors = []
     meta: List[Dict] = []
-    for name, paths in sorted(groups.items()):
-        if not paths:
-            continue
-        embs = []
-        rep_rel = None
-        for i, p in enumerate(paths[:20]):  # 최대 20장까지 샘플링
-            try:
-                with open(p, "rb") as f:
-                    emb = image_embedding(f.read())
-                embs.append(emb)
-                if rep_rel is None:
-                    # 대표 이미지 복사 (상대경로 저장)
-                    target = ACTOR_IMAGES_DIR / f"{name.replace(' ', '_')}{p.suffix.lower()}"
-                    if not target.exists():
-                        try:
-                            Image.open(p).save(target)
-                        except Exception:
-                            pass
-                    if target.exists():
-                        rep_rel = target.name
-            except Exception:
-                # 이미지 깨짐 등은 무시
-                continue
-        if not embs:
+    for name, rep_rel, lo, hi, mean_vec in zip(actor_names, rep_rels, starts, ends, means):
+        X = E[lo:hi]
+        if len(X) < clusters_per_actor:
+            vectors.append(mean_vec)
+            meta.append({"name": name, "image_rel": rep_rel})
             continue
-        X = np.stack(embs, axis=0)
-        if clusters_per_actor > 1 and len(embs) >= clusters_per_actor:
-            try:
-                from sklearn.cluster import KMeans  # type: ignore
-                km = KMeans(n_clusters=clusters_per_actor, n_init=10, random_state=42)
-                labels = km.fit_predict(X)
-                for c in range(clusters_per_actor):
-                    members = X[labels == c]
-                    if members.size == 0:
-                        continue
-                    centroid = members.mean(axis=0)
-                    centroid = centroid / (np.linalg.norm(centroid) + 1e-12)
-                    vectors.append(centroid.astype("float32"))
-                    meta.append({"name": name, "image_rel": rep_rel, "cluster": c})
-            except Exception:
-                # fallback to mean if sklearn not available
-                mean_vec = np.mean(X, axis=0)
-                mean_vec = mean_vec / (np.linalg.norm(mean_vec) + 1e-12)
-                vectors.append(mean_vec.astype("float32"))
-                meta.append({"name": name, "image_rel": rep_rel})
-        else:
-            mean_vec = np.mean(X, axis=0)
-            mean_vec = mean_vec / (np.linalg.norm(mean_vec) + 1e-12)
-            vectors.append(mean_vec.astype("float32"))
+        try:
+            from sklearn.cluster import KMeans  # type: ignore
+            km = KMeans(n_clusters=clusters_per_actor, n_init=10, random_state=42)
+            labels = km.fit_predict(X)
+            for c in range(clusters_per_actor):
+                members = X[labels == c]
+                if members.size == 0:
+                    continue
+                centroid = members.mean(axis=0)
+                centroid = centroid / (np.linalg.norm(centroid) + 1e-12)
+                vectors.append(centroid.astype("float32"))
+                meta.append({"name": name, "image_rel": rep_rel, "cluster": c})
+        except Exception:
+            # fallback to mean if sklearn not available
+            vectors.append(mean_vec)
             meta.append({"name": name, "image_rel": rep_rel})
     return np.stack(vectors, axis=0), meta
 
@@ -116,6 +172,7 @@ def main():
     parser.add_argument("--dataset-dir", type=str, help="배우 이미지 루트 폴더")
     parser.add_argument("--csv", type=str, help="'name,image_path' CSV 파일 경로")
     parser.add_argument("--clusters-per-actor", type=int, default=1, help="배우별 클러스터 개수 (>=1)")
+    parser.add_argument("--batch-size", type=int, default=64, help="CLIP 추론 배치 크기")
     args = parser.parse_args()
 
     DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -131,10 +188,21 @@ def main():
     if not groups:
         raise SystemExit("데이터셋에서 이미지를 찾지 못했습니다")
 
-    emb, meta = compute_actor_vectors(groups, clusters_per_actor=max(1, int(args.clusters_per_actor)))
-    np.save(DATA_DIR / "embeddings.npy", emb)
+    emb, meta = compute_actor_vectors(
+        groups,
+        clusters_per_actor=max(1, int(args.clusters_per_actor)),
+        batch_size=max(1, int(args.batch_size)),
+    )
+    # 서버는 정규화를 다시 하지 않으므로 저장 전에 한 번 더 보장
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True) + 1e-12
+    # float16로 저장해 탐색 시 메모리 대역폭을 절반으로 (faiss 인덱스는 float32 원본으로 생성)
+    np.save(DATA_DIR / "embeddings.npy", emb.astype(np.float16))
     with open(DATA_DIR / "metadata.json", "w", encoding="utf-8") as f:
         json.dump(meta, f, ensure_ascii=False, indent=2)
+    # 8bit 양자화 faiss 인덱스 (faiss 미설치 시 서버가 embeddings.npy로 직접 인덱싱)
+    if not save_quantized_index(emb):
+        INDEX_PATH.unlink(missing_ok=True)
+        print("faiss 미설치: index.faiss 생략")
 
     print(f"완료: {emb.shape[0]}명 저장, 벡터 차원 {emb.shape[1]}")
     print(f"경로: {DATA_DIR}")
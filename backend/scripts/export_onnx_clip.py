@@ -0,0 +1,29 @@
+"""
+CLIP 이미지 인코더 ONNX 내보내기 스크립트
+
+embeddings.py가 사용하는 CLIP 모델(CLIP_MODEL, 기본 openai/clip-vit-base-patch32)의
+이미지 인코더를 ONNX로 내보냅니다. 출력 파일이 존재하고 onnxruntime이 설치되어 있으면
+서버는 PyTorch 대신 ONNX Runtime으로 임베딩을 계산합니다.
+
+출력: backend/app/data/clip_vision.onnx (CLIP_ONNX_PATH로 변경 가능)
+"""
+from __future__ import annotations
+import argparse
+from pathlib import Path
+
+from backend.app.services.embeddings import MODEL_NAME
+from backend.app.services.onnx_clip import ONNX_PATH, export_vision_onnx
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default=MODEL_NAME, help="HF CLIP 모델 이름 (인덱스 생성 모델과 같아야 함)")
+    parser.add_argument("--out", type=str, default=str(ONNX_PATH), help="출력 ONNX 파일 경로")
+    args = parser.parse_args()
+
+    out = export_vision_onnx(args.model, Path(args.out))
+    print(f"완료: {args.model} -> {out}")
+
+
+if __name__ == "__main__":
+    main()
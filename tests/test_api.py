@@ -30,3 +30,89 @@ def test_match_without_index():
         assert isinstance(data["results"], list)
     else:
         assert r.status_code in {503, 500, 400}
+
+
+def _png(red: int) -> bytes:
+    import io
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), color=(red, 0, 0)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class _FakeIndex:
+    """Matches every query to the actor whose id is the query's first component."""
+
+    def search_batch(self, queries, k=3):
+        return [[(int(q[0]), 1.0)] for q in queries]
+
+    def info(self, idx):
+        return {"name": f"Actor {idx}", "image_rel": None}
+
+
+@pytest.fixture
+def batch_stubs(monkeypatch):
+    """Stub decoding/CLIP/search in the batch endpoint; returns the embed_prepared batch sizes."""
+    import io
+    from collections import OrderedDict
+
+    import numpy as np
+    from PIL import Image
+
+    from backend.app import main
+    from backend.app.services import embeddings
+
+    calls = []
+
+    def fake_prepare(src):
+        img = Image.open(io.BytesIO(src) if isinstance(src, bytes) else src).convert("RGB")
+        return np.array([img.getpixel((0, 0))[0], 0.0], dtype="float32")
+
+    def fake_embed(pixels, on_device=False):
+        calls.append(len(pixels))
+        return np.stack(pixels)
+
+    monkeypatch.setattr(main, "prepare_pixels", fake_prepare)
+    monkeypatch.setattr(main, "embed_prepared", fake_embed)
+    monkeypatch.setattr(main, "INDEX", _FakeIndex())
+    monkeypatch.setattr(embeddings, "_EMB_CACHE", OrderedDict())
+    return calls
+
+
+def test_batch_keeps_order_and_reports_errors(batch_stubs, monkeypatch):
+    from backend.app import main
+
+    monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 1000)
+    files = [
+        ("files", ("a.png", _png(10), "image/png")),
+        ("files", ("notes.txt", b"hello", "text/plain")),
+        ("files", ("broken.png", b"not an image", "image/png")),
+        ("files", ("big.png", b"\0" * 2000, "image/png")),
+        ("files", ("b.png", _png(20), "image/png")),
+    ]
+    r = client.post("/match-actors-batch", files=files)
+    assert r.status_code == 200
+    items = r.json()["items"]
+    assert [item["filename"] for item in items] == ["a.png", "notes.txt", "broken.png", "big.png", "b.png"]
+    assert items[0]["results"][0]["name"] == "Actor 10"
+    assert items[1]["error"] == "이미지 아님"
+    assert items[2]["error"].startswith("처리 실패")
+    assert items[3]["error"] == "파일이 너무 큼(>10MB)"
+    assert items[4]["results"][0]["name"] == "Actor 20"
+    # both decodable images go through one CLIP forward pass
+    assert batch_stubs == [2]
+
+
+def test_batch_mixes_cache_hits_and_misses(batch_stubs):
+    r = client.post("/match-actors-batch", files=[("files", ("x.png", _png(30), "image/png"))])
+    assert r.json()["items"][0]["results"][0]["name"] == "Actor 30"
+    files = [
+        ("files", ("y.png", _png(40), "image/png")),
+        ("files", ("x-again.png", _png(30), "image/png")),
+        ("files", ("z.png", _png(50), "image/png")),
+    ]
+    items = client.post("/match-actors-batch", files=files).json()["items"]
+    assert [item["results"][0]["name"] for item in items] == ["Actor 40", "Actor 30", "Actor 50"]
+    # the repeated upload is served from the cache, only the two new images are embedded
+    assert batch_stubs == [1, 2]
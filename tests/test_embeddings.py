@@ -0,0 +1,118 @@
+import io
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from backend.app.services import embeddings
+
+
+class _ImageProcessorOnly:
+    """CLIPProcessor stand-in with the default CLIP image config (no checkpoint download)."""
+
+    def __init__(self):
+        self.image_processor = transformers.CLIPImageProcessor()
+
+    def __call__(self, images, return_tensors):
+        return self.image_processor(images=images, return_tensors=return_tensors)
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    proc = _ImageProcessorOnly()
+    monkeypatch.setattr(embeddings, "get_processor", lambda: proc)
+    embeddings._preprocess_spec.cache_clear()
+    embeddings._get_transform.cache_clear()
+    yield proc
+    embeddings._preprocess_spec.cache_clear()
+    embeddings._get_transform.cache_clear()
+
+
+def _smooth_image(h, w, seed=0):
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    return Image.fromarray(coarse).resize((w, h), Image.BILINEAR)
+
+
+@pytest.mark.parametrize("path", ["numba", "torchvision", "processor"])
+@pytest.mark.parametrize("size", [(300, 403), (640, 480), (112, 112)])  # last: upscaled face chip
+def test_pixel_values_match_processor(processor, monkeypatch, path, size):
+    if path == "numba" and not (embeddings._NUMBA_AVAILABLE and embeddings._CV2_AVAILABLE):
+        pytest.skip("numba/opencv not installed")
+    if path == "torchvision" and not embeddings._TORCHVISION_AVAILABLE:
+        pytest.skip("torchvision not installed")
+    if path != "numba":
+        monkeypatch.setattr(embeddings, "_NUMBA_AVAILABLE", False)
+    if path == "processor":
+        monkeypatch.setattr(embeddings, "_TORCHVISION_AVAILABLE", False)
+    img = _smooth_image(*size)
+    expected = processor.image_processor(images=[img], return_tensors="np")["pixel_values"]
+    got = embeddings._pixel_values([img]).numpy()
+    assert got.shape == expected.shape
+    diff = np.abs(got - expected)
+    assert diff.mean() < 0.02
+    assert diff.max() < 0.15
+
+
+@pytest.fixture
+def emb_cache(monkeypatch):
+    monkeypatch.setattr(embeddings, "_EMB_CACHE", OrderedDict())
+    monkeypatch.setattr(embeddings, "_cache_generation", embeddings._cache_generation)
+    return embeddings._EMB_CACHE
+
+
+def _row(v):
+    return np.full(4, v, dtype="float32")
+
+
+def test_cache_evicts_least_recently_used(emb_cache, monkeypatch):
+    monkeypatch.setattr(embeddings, "QUERY_CACHE_SIZE", 2)
+    embeddings.cache_embedding("a", _row(1))
+    embeddings.cache_embedding("b", _row(2))
+    assert embeddings.cached_embedding("a")[0] == 1  # "a" is now the most recent
+    embeddings.cache_embedding("c", _row(3))
+    assert embeddings.cached_embedding("b") is None
+    assert embeddings.cached_embedding("a")[0] == 1
+    assert embeddings.cached_embedding("c")[0] == 3
+    assert len(emb_cache) == 2
+
+
+def test_cached_rows_are_read_only_copies(emb_cache):
+    row = _row(1)
+    stored = embeddings.cache_embedding("a", row)
+    row[:] = 5
+    assert embeddings.cached_embedding("a")[0] == 1
+    assert not stored.flags.writeable
+
+
+def test_reload_models_expires_cached_embeddings(emb_cache):
+    embeddings.cache_embedding("a", _row(1))
+    old_generation = embeddings._cache_generation
+    embeddings.reload_models()
+    assert embeddings.cached_embedding("a") is None
+    # a request that embedded with the old weights and stores its row after the reload
+    emb_cache[(old_generation, "a")] = _row(1)
+    assert embeddings.cached_embedding("a") is None
+    embeddings.cache_embedding("a", _row(2))
+    assert embeddings.cached_embedding("a")[0] == 2
+
+
+def test_cache_size_zero_disables_cache(emb_cache, monkeypatch):
+    monkeypatch.setattr(embeddings, "QUERY_CACHE_SIZE", 0)
+    assert embeddings.cache_embedding("a", _row(1))[0] == 1
+    assert embeddings.cached_embedding("a") is None
+    assert len(emb_cache) == 0
+
+
+def test_content_hash_rewinds_file(emb_cache):
+    data = bytes(range(256)) * 8192  # spans several read chunks
+    f = io.BytesIO(data)
+    f.seek(10)
+    digest = embeddings.content_hash(f)
+    assert f.tell() == 10
+    assert digest == embeddings.content_hash(data[10:])
+    assert digest != embeddings.content_hash(data)
@@ -0,0 +1,101 @@
+import json
+
+import numpy as np
+import pytest
+
+from backend.app.services import search
+
+
+def _make_index(tmp_path, monkeypatch, dtype, n):
+    rng = np.random.default_rng(0)
+    emb = rng.standard_normal((n, 16)).astype("float32")
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    np.save(tmp_path / "embeddings.npy", emb.astype(dtype))
+    meta = [{"name": f"Actor {i}", "image_rel": None} for i in range(len(emb))]
+    (tmp_path / "metadata.json").write_text(json.dumps(meta), encoding="utf-8")
+    monkeypatch.setattr(search, "EMB_PATH", tmp_path / "embeddings.npy")
+    monkeypatch.setattr(search, "META_PATH", tmp_path / "metadata.json")
+    monkeypatch.setattr(search, "INDEX_PATH", tmp_path / "index.faiss")
+    return search.ActorIndex(), emb
+
+
+@pytest.fixture(params=["float32", "float16"])
+def index(request, tmp_path, monkeypatch):
+    return _make_index(tmp_path, monkeypatch, request.param, 50)
+
+
+@pytest.fixture(params=["float32", "float16"])
+def numpy_index(request, tmp_path, monkeypatch):
+    # neither faiss nor the Numba kernel: argpartition over a scan spanning several tiles
+    monkeypatch.setattr(search, "_FAISS_AVAILABLE", False)
+    monkeypatch.setattr(search, "NUMBA_TOPK_MAX_ROWS", 0)
+    idx, emb = _make_index(tmp_path, monkeypatch, request.param, 2 * search.TILE_ROWS + 7)
+    return idx, emb.astype(request.param).astype("float32")
+
+
+def test_topk_matches_bruteforce(index):
+    idx, emb = index
+    q = emb[7] + 0.1 * emb[3]
+    q /= np.linalg.norm(q)
+    top = idx.topk(q, k=3)
+    expected = np.argsort(-(emb @ q))[:3]
+    assert [i for i, _ in top] == expected.tolist()
+    assert top[0][1] == pytest.approx(float(emb[7] @ q), abs=1e-3)
+
+
+def test_topk_k_larger_than_index(index):
+    idx, emb = index
+    top = idx.topk(emb[0], k=len(emb) + 5)
+    assert len(top) == len(emb)
+    assert top[0][0] == 0
+
+
+def test_search_batch_matches_topk(index):
+    idx, emb = index
+    queries = emb[[2, 11, 30]]
+    batched = idx.search_batch(queries, k=4)
+    for row, q in zip(batched, queries):
+        single = idx.topk(q, k=4)
+        assert [i for i, _ in row] == [i for i, _ in single]
+        assert [s for _, s in row] == pytest.approx([s for _, s in single], abs=1e-5)
+
+
+def test_prebuilt_quantized_index(index, tmp_path, monkeypatch):
+    pytest.importorskip("faiss")
+    idx, emb = index
+    assert search.save_quantized_index(emb, tmp_path / "index.faiss")
+    top = idx.topk(emb[5], k=3)
+    assert type(idx._index).__name__ == "IndexScalarQuantizer"
+    assert top[0][0] == 5
+    assert top[0][1] == pytest.approx(1.0, abs=2e-2)
+
+
+@pytest.mark.parametrize("numba_rows", [0, 50_000])
+def test_numba_and_faiss_paths_agree(index, monkeypatch, numba_rows):
+    monkeypatch.setattr(search, "NUMBA_TOPK_MAX_ROWS", numba_rows)
+    idx, emb = index
+    q = emb[[4, 9]].astype("float32")
+    expected = np.argsort(-(q @ emb.astype("float32").T), axis=1)[:, :5]
+    assert [[i for i, _ in row] for row in idx.search_batch(q, k=5)] == expected.tolist()
+    if numba_rows and search._NUMBA_AVAILABLE:
+        # scans the memory-mapped rows in place
+        assert idx._numba and isinstance(idx._emb, np.memmap)
+
+
+def test_numpy_scan_matches_bruteforce(numpy_index):
+    idx, emb = numpy_index
+    q = emb[[3, search.TILE_ROWS + 1, len(emb) - 1]]
+    batched = idx.search_batch(q, k=5)
+    assert idx._index is None
+    sims = q @ emb.T
+    expected = np.argsort(-sims, axis=1)[:, :5]
+    assert [[i for i, _ in row] for row in batched] == expected.tolist()
+    for row, row_sims in zip(batched, sims):
+        assert [s for _, s in row] == pytest.approx(row_sims[[i for i, _ in row]].tolist(), abs=1e-5)
+
+
+def test_numpy_scan_k_larger_than_index(numpy_index):
+    idx, emb = numpy_index
+    top = idx.topk(emb[4], k=len(emb) + 5)
+    assert len(top) == len(emb)
+    assert top[0][0] == 4